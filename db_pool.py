@@ -0,0 +1,113 @@
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from aiosqlitepool import SQLiteConnectionPool
+
+DB_PATH = "market_terminal.db"
+DEFAULT_WATCHLISTS = [(1, "My Portfolio"), (2, "Growth Stocks"), (3, "Value Picks")]
+DEFAULT_STOCKS = ["RELIANCE", "TCS", "INFY", "HDFCBANK", "ITC"]
+
+pool = None
+
+async def connect_db():
+    # हर pooled connection पर एक बार PRAGMA set होते हैं
+    conn = await aiosqlite.connect(DB_PATH)
+    conn.row_factory = aiosqlite.Row
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    # ~20 MB page cache और 256 MB mmap ताकि hot pages memory में रहें
+    await conn.execute("PRAGMA cache_size=-20000")
+    await conn.execute("PRAGMA temp_store=MEMORY")
+    await conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+async def open_pool():
+    global pool
+    # हर worker के long-lived connections; छोटे data set के लिए DB_POOL_SIZE=1 भी काफी है
+    # (env यहीं पढ़ें, क्योंकि main.py में load_dotenv() इस module के import के बाद चलता है)
+    pool = SQLiteConnectionPool(connect_db, pool_size=int(os.getenv("DB_POOL_SIZE", 5)))
+    # पहला connection अभी खोल लें ताकि पहली request open + PRAGMA का खर्च न दे
+    async with pool.connection():
+        pass
+
+async def close_pool():
+    await pool.close()
+
+@asynccontextmanager
+async def get_conn():
+    async with pool.connection() as conn:
+        yield conn
+
+def init_db():
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    # पूरा schema setup और seeding एक transaction में; साथ start होने वाले workers
+    # एक-एक करके write lock लेते हैं
+    cursor.execute("BEGIN IMMEDIATE")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS watchlists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS watchlist_stocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            watchlist_id INTEGER,
+            symbol TEXT NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            added_ts INTEGER DEFAULT (strftime('%s', 'now')),
+            FOREIGN KEY (watchlist_id) REFERENCES watchlists (id)
+        )
+    """)
+
+    # पुराने DB में added_ts column नहीं है; ALTER TABLE non-constant default नहीं लेता,
+    # इसलिए बिना default जोड़ें और added_at से backfill करें (नए inserts इसे खुद set करते हैं)
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(watchlist_stocks)")}
+    if "added_ts" not in columns:
+        cursor.execute("ALTER TABLE watchlist_stocks ADD COLUMN added_ts INTEGER")
+        cursor.execute("UPDATE watchlist_stocks SET added_ts = strftime('%s', added_at)")
+
+    # पुराने DB में duplicate rows हो सकती हैं (पहले seeding हर startup पर दोहराई जाती थी),
+    # unique index बनाने से पहले उन्हें हटाएं; index बन जाने के बाद duplicates हो ही नहीं सकते
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ix_ws_wid_sym'"
+    )
+    if cursor.fetchone() is None:
+        cursor.execute("""
+            DELETE FROM watchlist_stocks WHERE id NOT IN (
+                SELECT MIN(id) FROM watchlist_stocks GROUP BY watchlist_id, symbol
+            )
+        """)
+        cursor.execute(
+            "CREATE UNIQUE INDEX ix_ws_wid_sym ON watchlist_stocks (watchlist_id, symbol)"
+        )
+    # ordering अब integer added_ts पर; पुराना text-based index हटा दें
+    cursor.execute("DROP INDEX IF EXISTS ix_ws_wid_added")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS ix_ws_wid_ts ON watchlist_stocks (watchlist_id, added_ts)"
+    )
+
+    # डिफ़ॉल्ट watchlists और stocks सिर्फ खाली DB में बनाएं
+    cursor.execute("SELECT 1 FROM watchlists LIMIT 1")
+    if cursor.fetchone() is None:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO watchlists (id, name) VALUES (?, ?)",
+            DEFAULT_WATCHLISTS,
+        )
+
+    cursor.execute("SELECT 1 FROM watchlist_stocks LIMIT 1")
+    if cursor.fetchone() is None:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO watchlist_stocks (watchlist_id, symbol, added_ts) "
+            "VALUES (1, ?, strftime('%s', 'now'))",
+            [(stock,) for stock in DEFAULT_STOCKS],
+        )
+
+    conn.commit()
+    conn.close()
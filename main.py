@@ -1,21 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-import sqlite3
+from pydantic import BaseModel, StringConstraints
+import asyncio
+import contextlib
+import functools
+import hashlib
 import os
-from datetime import datetime
-from typing import List
+import orjson
+import time
+import types
+import zlib
+from datetime import datetime, time as dtime, timedelta, timezone
+from typing import Annotated, Dict, List
 import uvicorn
 from dotenv import load_dotenv
+from db_pool import close_pool, get_conn, init_db, open_pool
+import httpx
 import pyotp
 
-# SmartConnect import करें (यह Angel One का Python SDK है)
-from SmartApi import SmartConnect
-
 load_dotenv()
 
-app = FastAPI(title="Market Terminal API")
+app = FastAPI(title="Market Terminal API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +32,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# एक ही quote market hours में LTP_TTL सेकंड तक सभी requests में reuse होता है;
+# market बंद होने पर कीमतें नहीं बदलतीं, इसलिए तब TTL लंबा रखते हैं
+LTP_CACHE_TTL = float(os.getenv("LTP_TTL", "1.0"))
+LTP_CLOSED_TTL = 60.0
+IST = timezone(timedelta(hours=5, minutes=30))
+MARKET_OPEN = dtime(9, 15)
+MARKET_CLOSE = dtime(15, 30)
+QUOTE_ROUTE = "/rest/secure/angelbroking/market/v1/quote/"
+# quote endpoint एक call में 50 tokens तक लेता है
+QUOTE_BATCH_SIZE = 50
+# quote call read-only है, इसलिए upstream gateway errors पर इसे दोबारा भेजना सुरक्षित है
+QUOTE_RETRIES = 2
+RETRY_STATUSES = (502, 503, 504)
+# (name, exchange, token); output में indices इसी क्रम में रहते हैं, upstream response token से match होता है
+INDICES = [
+    ("NIFTY 50", "NSE", "99926000"),
+    ("SENSEX", "BSE", "99919000"),
+    ("BANK NIFTY", "NSE", "99926009"),
+]
+INDICES_REFRESH_INTERVAL = 5.0
+QUOTES_REFRESH_MIN_INTERVAL = 0.5
+# SmartAPI 10 req/s तक ही लेता है; एक साथ इससे ज़्यादा upstream quote calls और connections नहीं
+UPSTREAM_CONCURRENCY = 10
+# HTTP/2 पर एक connection में कई streams चलते हैं, इसलिए connection limit अकेले काफी नहीं
+UPSTREAM_SEM = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+
+# कुछ महत्वपूर्ण symbol tokens (जरूरत के अनुसार बढ़ा सकते हैं); read-only और सभी instances में shared
+SYMBOL_TOKENS = types.MappingProxyType({
+    "RELIANCE": "2885",
+    "TCS": "11536",
+    "INFY": "1594",
+    "HDFCBANK": "1333",
+    "ITC": "424",
+    "SBIN": "3045",
+})
+
+def parse_quote(d: dict) -> dict:
+    # OHLC mode में close मिलता है जिससे change निकलता है
+    ltp = d.get("ltp")
+    close = d.get("close")
+    change = round(ltp - close, 2) if ltp is not None and close else 0
+    return {
+        "ltp": ltp,
+        "change": change,
+        "changePercent": round(change / close * 100, 2) if close else 0,
+    }
+
+def ltp_ttl() -> float:
+    now = datetime.now(IST)
+    if now.weekday() < 5 and MARKET_OPEN <= now.time() <= MARKET_CLOSE:
+        return LTP_CACHE_TTL
+    return LTP_CLOSED_TTL
+
 class AngelOneAPI:
     def __init__(self):
         self.api_key    = os.getenv("ANGEL_API_KEY")
@@ -34,233 +94,450 @@ class AngelOneAPI:
         self.totp_secret = os.getenv("ANGEL_TOTP_SECRET")
         # SmartConnect में API key और secret दोनों दें
         if self.api_key and self.api_secret:
+            # SmartConnect (Angel One का Python SDK) भारी है, इसलिए credentials होने पर ही import करें
+            from SmartApi import SmartConnect
+            # SmartConnect सिर्फ login (signing) के लिए; quotes httpx client से आते हैं
             self.smart = SmartConnect(api_key=self.api_key, api_secret=self.api_secret)
         else:
             self.smart = None
+        # TOTP object एक बार बनाएं (Google Authenticator secret)
+        self._totp = pyotp.TOTP(self.totp_secret) if self.totp_secret else None
         self.jwt_token = None
         self.feed_token = None
-        # कुछ महत्वपूर्ण symbol tokens (जरूरत के अनुसार बढ़ा सकते हैं)
-        self.symbol_tokens = {
-            "RELIANCE": "2885",
-            "TCS": "11536",
-            "INFY": "1594",
-            "HDFCBANK": "1333",
-            "ITC": "424",
-            "SBIN": "3045",
-        }
+        self.client = None
+        # symbol -> (fetched_at, quote)
+        self._ltp_cache = {}
+        # symbol -> Future, जिन symbols का upstream fetch अभी चल रहा है
+        self._inflight = {}
 
-    def generate_session(self) -> bool:
-        if not self.smart or not all([self.client_code, self.password, self.totp_secret]):
+    async def generate_session(self) -> bool:
+        if not self.smart or not all([self.client_code, self.password, self._totp]):
             return False
         try:
-            # TOTP कोड generate करें (Google Authenticator secret)
-            totp_code = pyotp.TOTP(self.totp_secret).now()
-            # लॉगिन करें
-            data = self.smart.generateSession(self.client_code, self.password, totp_code)
+            totp_code = self._totp.now()
+            # लॉगिन करें (SmartConnect sync requests पर चलता है, इसलिए thread में)
+            data = await asyncio.to_thread(
+                self.smart.generateSession, self.client_code, self.password, totp_code
+            )
             if not data or not data.get("status"):
                 return False
             self.jwt_token = data["data"]["jwtToken"]
             self.feed_token = self.smart.getfeedToken()
+            # एक ही persistent HTTP/2 client; सभी quote calls इसके keep-alive connections पर multiplex होती हैं
+            headers = self.smart.requestHeaders()
+            headers["Authorization"] = f"Bearer {self.smart.access_token}"
+            # transport देने पर client के http2/limits ignore होते हैं, इसलिए दोनों transport पर ही
+            self.client = httpx.AsyncClient(
+                base_url=self.smart.root,
+                headers=headers,
+                timeout=2.0,
+                transport=httpx.AsyncHTTPTransport(
+                    http2=True,
+                    retries=2,
+                    limits=httpx.Limits(
+                        max_connections=UPSTREAM_CONCURRENCY,
+                        max_keepalive_connections=UPSTREAM_CONCURRENCY,
+                    ),
+                ),
+            )
+            # पहला quote batch अभी भेजकर connection warm करें (साथ में cache भी भर जाता है)
+            await self.get_ltp_batch(list(SYMBOL_TOKENS))
             return True
         except Exception:
             return False
 
-    def get_ltp(self, symbol: str):
-        if not self.smart or not self.jwt_token:
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+
+    async def fetch_market_data(self, mode: str, exchange_tokens: Dict[str, List[str]]):
+        # transport सिर्फ connect errors retry करता है; gateway 5xx पर यहाँ backoff के साथ दोबारा
+        for attempt in range(QUOTE_RETRIES + 1):
+            async with UPSTREAM_SEM:
+                resp = await self.client.post(
+                    QUOTE_ROUTE, json={"mode": mode, "exchangeTokens": exchange_tokens}
+                )
+            if resp.status_code not in RETRY_STATUSES or attempt == QUOTE_RETRIES:
+                break
+            await asyncio.sleep(0.2 * 2 ** attempt)
+        return resp.json()
+
+    async def get_indices(self):
+        if not self.client:
             return None
-        sym = symbol.upper().strip()
-        token = self.symbol_tokens.get(sym)
-        if not token:
+        exchange_tokens = {}
+        for _, exchange, token in INDICES:
+            exchange_tokens.setdefault(exchange, []).append(token)
+        resp = await self.fetch_market_data("OHLC", exchange_tokens)
+        if not resp or not resp.get("status") or not resp.get("data"):
             return None
-        try:
-            tradingsymbol = f"{sym}-EQ"
-            resp = self.smart.ltpData("NSE", tradingsymbol, token)
-            if resp and resp.get("status") and resp.get("data"):
-                d = resp["data"]
-                return {
-                    "ltp": d.get("ltp"),
-                    "change": d.get("change", 0),
-                    "changePercent": d.get("pChange", 0),
-                }
-        except Exception:
+        quotes = {str(d.get("symbolToken")): parse_quote(d) for d in resp["data"].get("fetched") or []}
+        # कोई index छूट जाए तो पूरा पुराना snapshot ही रखें
+        if any(token not in quotes for _, _, token in INDICES):
             return None
+        return [
+            {
+                "name": name,
+                "value": quotes[token]["ltp"],
+                "change": quotes[token]["change"],
+                "changePercent": quotes[token]["changePercent"],
+            }
+            for name, _, token in INDICES
+        ]
+
+    def cached_ltp(self, sym: str, ttl: float):
+        cached = self._ltp_cache.get(sym)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
         return None
 
+    async def get_quotes(self, symbols: List[str], refresh: bool = False) -> Dict[str, dict]:
+        if not self.client:
+            return {}
+        quotes = {}
+        waiting = {}
+        # इस call के अपने futures; एक ही symbol की concurrent requests इन्हीं का इंतज़ार करती हैं
+        owned = {}
+        to_fetch = []
+        loop = asyncio.get_running_loop()
+        ttl = ltp_ttl()
+        for symbol in symbols:
+            sym = symbol.upper().strip()
+            # refresh पर cache छोड़ दें, पर चल रहे fetch का इंतज़ार फिर भी करें
+            quote = None if refresh else self.cached_ltp(sym, ttl)
+            if quote:
+                quotes[symbol] = quote
+            elif sym in self._inflight:
+                waiting[symbol] = self._inflight[sym]
+            elif sym in SYMBOL_TOKENS:
+                owned[sym] = self._inflight[sym] = loop.create_future()
+                waiting[symbol] = owned[sym]
+                to_fetch.append(symbol)
+        if owned:
+            try:
+                fetched = await self.get_ltp_batches(to_fetch, refresh=refresh)
+                for symbol in to_fetch:
+                    fut = owned[symbol.upper().strip()]
+                    if not fut.done():
+                        fut.set_result(fetched.get(symbol))
+            finally:
+                for sym, fut in owned.items():
+                    if not fut.done():
+                        fut.set_result(None)
+                    self._inflight.pop(sym, None)
+        for symbol, fut in waiting.items():
+            quote = await asyncio.shield(fut)
+            if quote:
+                quotes[symbol] = quote
+        return quotes
 
-angel_api = AngelOneAPI()
+    async def get_ltp_batches(self, symbols: List[str], refresh: bool = False) -> Dict[str, dict]:
+        # बड़े lists को QUOTE_BATCH_SIZE के chunks में बाँटकर साथ-साथ fetch करें
+        chunks = [symbols[i:i + QUOTE_BATCH_SIZE] for i in range(0, len(symbols), QUOTE_BATCH_SIZE)]
+        results = await asyncio.gather(*[
+            self.get_ltp_batch(chunk, refresh=refresh) for chunk in chunks
+        ])
+        quotes = {}
+        for result in results:
+            quotes.update(result)
+        return quotes
+
+    async def get_ltp_batch(self, symbols: List[str], refresh: bool = False) -> Dict[str, dict]:
+        if not self.client:
+            return {}
+        quotes = {}
+        # token -> symbols जो cache में नहीं मिले
+        missing = {}
+        ttl = ltp_ttl()
+        for symbol in symbols:
+            sym = symbol.upper().strip()
+            quote = None if refresh else self.cached_ltp(sym, ttl)
+            if quote:
+                quotes[symbol] = quote
+                continue
+            token = SYMBOL_TOKENS.get(sym)
+            if token:
+                missing.setdefault(token, []).append(symbol)
+        if not missing:
+            return quotes
+        try:
+            # सभी tokens एक ही quote call में
+            resp = await self.fetch_market_data("OHLC", {"NSE": list(missing)})
+        except Exception:
+            return quotes
+        if not resp or not resp.get("status") or not resp.get("data"):
+            return quotes
+        fetched_at = time.monotonic()
+        for d in resp["data"].get("fetched") or []:
+            requested = missing.get(str(d.get("symbolToken")))
+            if not requested:
+                continue
+            quote = parse_quote(d)
+            self._ltp_cache[requested[0].upper().strip()] = (fetched_at, quote)
+            for symbol in requested:
+                quotes[symbol] = quote
+        return quotes
+
+
+# हर worker में client पहली जरूरत पर ही बनता है
+@functools.lru_cache(maxsize=1)
+def get_angel() -> AngelOneAPI:
+    return AngelOneAPI()
+
+# symbols pydantic-core में ही strip और uppercase हो जाते हैं; name पर यह लागू नहीं होता
+Symbol = Annotated[str, StringConstraints(strip_whitespace=True, to_upper=True)]
 
 class WatchlistCreate(BaseModel):
     name: str
-    symbols: List[str] = []
+    symbols: List[Symbol] = []
 
 class StockAdd(BaseModel):
-    symbol: str
+    symbol: Symbol
 
-def init_db():
-    conn = sqlite3.connect("market_terminal.db")
-    cursor = conn.cursor()
+# GET /api/watchlists का cached response: (filled_at, payload)। हर write के बाद खाली होता है;
+# TTL इसलिए कि दूसरे workers का invalidation यहाँ तक नहीं पहुँचता
+WATCHLISTS_CACHE_TTL = 5.0
+watchlists_cache = None
+watchlists_lock = asyncio.Lock()
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS watchlists (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS watchlist_stocks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            watchlist_id INTEGER,
-            symbol TEXT NOT NULL,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (watchlist_id) REFERENCES watchlists (id)
-        )
-    """)
-
-    # डिफ़ॉल्ट watchlists बनाएं
-    cursor.execute("INSERT OR IGNORE INTO watchlists (id, name) VALUES (1, 'My Portfolio')")
-    cursor.execute("INSERT OR IGNORE INTO watchlists (id, name) VALUES (2, 'Growth Stocks')")
-    cursor.execute("INSERT OR IGNORE INTO watchlists (id, name) VALUES (3, 'Value Picks')")
-
-    default_stocks = ["RELIANCE", "TCS", "INFY", "HDFCBANK", "ITC"]
-    for stock in default_stocks:
-        cursor.execute(
-            "INSERT OR IGNORE INTO watchlist_stocks (watchlist_id, symbol) VALUES (1, ?)",
-            (stock,),
-        )
+async def invalidate_watchlists():
+    global watchlists_cache
+    # lock के अंदर clear करें ताकि चल रहा fill पुराना data वापस न रख दे
+    async with watchlists_lock:
+        watchlists_cache = None
+
+async def refresh_quotes():
+    # सभी watchlists के symbols के quotes background में ताज़ा रखें, ताकि requests cache से serve हों
+    while True:
+        try:
+            async with get_conn() as conn:
+                cursor = await conn.execute("SELECT DISTINCT symbol FROM watchlist_stocks")
+                symbols = [row["symbol"] async for row in cursor]
+            # get_quotes से ताकि refresh भी _inflight में दिखे और cache miss वाली requests उसी का इंतज़ार करें
+            await get_angel().get_quotes(symbols, refresh=True)
+        except Exception:
+            pass
+        # TTL से आधे interval पर refresh ताकि cached entries बीच में expire न हों;
+        # LTP_TTL बहुत छोटा हो तब भी upstream पर hot loop न बने
+        await asyncio.sleep(max(ltp_ttl() / 2, QUOTES_REFRESH_MIN_INTERVAL))
+
+async def refresh_indices():
+    # indices भी background में; handler सिर्फ तैयार JSON bytes लौटाता है
+    while True:
+        try:
+            indices = await get_angel().get_indices()
+            if indices:
+                app.state.indices_json = orjson.dumps({"indices": indices})
+        except Exception:
+            pass
+        await asyncio.sleep(INDICES_REFRESH_INTERVAL)
 
-    conn.commit()
-    conn.close()
+def etag_response(request: Request, payload) -> Response:
+    # client के पास वही body हो (If-None-Match) तो 304, वरना ETag के साथ JSON
+    body = payload if isinstance(payload, bytes) else orjson.dumps(payload)
+    etag = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+    headers = {"ETag": etag, "Cache-Control": "max-age=1"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 @app.on_event("startup")
 async def startup_event():
-    init_db()
-    ok = angel_api.generate_session()
-    print("Angel One session:", "Connected" if ok else "Mock")
+    app.state.indices_json = DEFAULT_INDICES_JSON
+    # init_db sync sqlite3 पर चलता है; कई workers साथ start हों तो lock का इंतज़ार loop को न रोके
+    await asyncio.to_thread(init_db)
+    await open_pool()
+    ok = await get_angel().generate_session()
+    # login status सिर्फ यहीं बदलता है; /health हर poll पर इसे ही लौटाता है
+    app.state.angel_status = "Connected" if ok else "Mock"
+    print("Angel One session:", app.state.angel_status)
+    app.state.refreshers = (
+        [asyncio.create_task(refresh_quotes()), asyncio.create_task(refresh_indices())] if ok else []
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in app.state.refreshers:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await get_angel().close()
+    await close_pool()
 
 @app.get("/api/watchlists")
-async def get_watchlists():
-    conn = sqlite3.connect("market_terminal.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT w.id, w.name, COUNT(ws.symbol) as stock_count
-        FROM watchlists w
-        LEFT JOIN watchlist_stocks ws ON w.id = ws.watchlist_id
-        GROUP BY w.id, w.name
-        ORDER BY w.id
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-    return {
-        "watchlists": [{"id": r[0], "name": r[1], "stock_count": r[2]} for r in rows]
-    }
+async def get_watchlists(request: Request):
+    global watchlists_cache
+    async with watchlists_lock:
+        if watchlists_cache and time.monotonic() - watchlists_cache[0] < WATCHLISTS_CACHE_TTL:
+            return etag_response(request, watchlists_cache[1])
+        async with get_conn() as conn:
+            # scalar subquery हर watchlist के लिए index से ही गिनती करता है, JOIN + GROUP BY नहीं
+            cursor = await conn.execute("""
+                SELECT w.id, w.name,
+                       (SELECT COUNT(*) FROM watchlist_stocks ws WHERE ws.watchlist_id = w.id) AS stock_count
+                FROM watchlists w
+                ORDER BY w.id
+            """)
+            rows = await cursor.fetchall()
+        payload = {
+            "watchlists": [{"id": r["id"], "name": r["name"], "stock_count": r["stock_count"]} for r in rows]
+        }
+        watchlists_cache = (time.monotonic(), payload)
+    return etag_response(request, payload)
 
 @app.post("/api/watchlists")
 async def create_watchlist(watchlist: WatchlistCreate):
-    conn = sqlite3.connect("market_terminal.db")
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO watchlists (name) VALUES (?)", (watchlist.name,))
-    watchlist_id = cursor.lastrowid
-    for symbol in watchlist.symbols:
-        cursor.execute(
-            "INSERT INTO watchlist_stocks (watchlist_id, symbol) VALUES (?, ?)",
-            (watchlist_id, symbol.upper()),
+    async with get_conn() as conn:
+        # write lock शुरू में ही लें; दोनों inserts एक transaction और एक WAL commit में
+        await conn.execute("BEGIN IMMEDIATE")
+        cursor = await conn.execute("INSERT INTO watchlists (name) VALUES (?)", (watchlist.name,))
+        watchlist_id = cursor.lastrowid
+        await conn.executemany(
+            "INSERT OR IGNORE INTO watchlist_stocks (watchlist_id, symbol, added_ts) "
+            "VALUES (?, ?, strftime('%s', 'now'))",
+            [(watchlist_id, symbol) for symbol in watchlist.symbols],
         )
-    conn.commit()
-    conn.close()
+        await conn.commit()
+    await invalidate_watchlists()
     return {"id": watchlist_id, "message": f"Watchlist '{watchlist.name}' created"}
 
 @app.post("/api/watchlists/{watchlist_id}/add-stock")
 async def add_stock(watchlist_id: int, stock: StockAdd):
-    conn = sqlite3.connect("market_terminal.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT COUNT(*) FROM watchlist_stocks WHERE watchlist_id = ? AND symbol = ?",
-        (watchlist_id, stock.symbol.upper()),
-    )
-    if cursor.fetchone()[0] > 0:
-        conn.close()
-        raise HTTPException(status_code=400, detail="Stock already exists in watchlist")
-    cursor.execute(
-        "INSERT INTO watchlist_stocks (watchlist_id, symbol) VALUES (?, ?)",
-        (watchlist_id, stock.symbol.upper()),
-    )
-    conn.commit()
-    conn.close()
+    async with get_conn() as conn:
+        # unique index की वजह से duplicate insert ignore होता है; check और insert एक ही statement में
+        cursor = await conn.execute(
+            "INSERT OR IGNORE INTO watchlist_stocks (watchlist_id, symbol, added_ts) "
+            "VALUES (?, ?, strftime('%s', 'now'))",
+            (watchlist_id, stock.symbol),
+        )
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=400, detail="Stock already exists in watchlist")
+        await conn.commit()
+    await invalidate_watchlists()
     return {"message": f"Stock {stock.symbol} added to watchlist"}
 
 @app.delete("/api/watchlists/{watchlist_id}/stocks/{symbol}")
 async def remove_stock(watchlist_id: int, symbol: str):
-    conn = sqlite3.connect("market_terminal.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "DELETE FROM watchlist_stocks WHERE watchlist_id = ? AND symbol = ?",
-        (watchlist_id, symbol.upper()),
-    )
-    conn.commit()
-    conn.close()
+    async with get_conn() as conn:
+        await conn.execute(
+            "DELETE FROM watchlist_stocks WHERE watchlist_id = ? AND symbol = ?",
+            (watchlist_id, symbol.upper()),
+        )
+        await conn.commit()
+    await invalidate_watchlists()
     return {"message": f"Stock {symbol} removed from watchlist"}
 
+# mock data fallback: हर symbol के लिए एक बार गणना, वही dict हर response में reuse होती है।
+# hash() हर process में अलग seed लेता है, crc32 सभी workers में एक जैसी कीमत देता है
+@functools.lru_cache(maxsize=4096)
+def mock_stock(symbol: str):
+    h = zlib.crc32(symbol.encode())
+    base = 1000 + h % 3000
+    delta = (h % 200) - 100
+    pct = delta / max(base, 1) * 100
+    return {
+        "symbol": symbol,
+        "ltp": base + delta,
+        "change": delta,
+        "changePercent": round(pct, 2),
+        "volume": 0,
+        "sector": "Technology",
+    }
+
+def build_stock(symbol: str, live_data):
+    if live_data:
+        return {
+            "symbol": symbol,
+            "ltp": live_data["ltp"],
+            "change": live_data["change"],
+            "changePercent": live_data["changePercent"],
+            "volume": 0,
+            "sector": "Live Data",
+        }
+    return mock_stock(symbol)
+
 @app.get("/api/watchlists/{watchlist_id}/stocks")
-async def get_watchlist_stocks(watchlist_id: int):
-    conn = sqlite3.connect("market_terminal.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT symbol FROM watchlist_stocks WHERE watchlist_id = ? ORDER BY added_at",
-        (watchlist_id,),
+async def get_watchlist_stocks(watchlist_id: int, request: Request):
+    async with get_conn() as conn:
+        cursor = await conn.execute(
+            "SELECT symbol FROM watchlist_stocks WHERE watchlist_id = ? ORDER BY added_ts",
+            (watchlist_id,),
+        )
+        symbols = [row["symbol"] async for row in cursor]
+
+    live_quotes = await get_angel().get_quotes(symbols)
+    return etag_response(
+        request, {"stocks": [build_stock(symbol, live_quotes.get(symbol)) for symbol in symbols]}
     )
-    rows = cursor.fetchall()
-    conn.close()
-
-    stocks = []
-    for (symbol,) in rows:
-        live_data = angel_api.get_ltp(symbol)
-        if live_data:
-            stocks.append({
-                "symbol": symbol,
-                "ltp": live_data["ltp"],
-                "change": live_data["change"],
-                "changePercent": live_data["changePercent"],
-                "volume": 0,
-                "sector": "Live Data",
-            })
-        else:
-            # mock data fallback
-            base = 1000 + hash(symbol) % 3000
-            delta = (hash(symbol) % 200) - 100
-            pct = delta / max(base, 1) * 100 
-            stocks.append({
-                "symbol": symbol,
-                "ltp": base + delta,
-                "change": delta,
-                "changePercent": round(pct, 2),
-                "volume": 0,
-                "sector": "Technology",
-            })
-
-    return {"stocks": stocks}
 
-@app.get("/api/market/indices")
-async def get_market_indices():
+@app.get("/api/watchlists/{watchlist_id}/full")
+async def get_watchlist_full(watchlist_id: int):
+    # watchlist का नाम और उसके stocks एक ही query में
+    async with get_conn() as conn:
+        cursor = await conn.execute(
+            """
+            SELECT w.name, ws.symbol
+            FROM watchlists w
+            LEFT JOIN watchlist_stocks ws ON ws.watchlist_id = w.id
+            WHERE w.id = ?
+            ORDER BY ws.added_ts
+            """,
+            (watchlist_id,),
+        )
+        rows = await cursor.fetchall()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Watchlist not found")
+
+    symbols = [row["symbol"] for row in rows if row["symbol"] is not None]
+    live_quotes = await get_angel().get_quotes(symbols)
     return {
-        "indices": [
-            {"name": "NIFTY 50", "value": 25674.25, "change": 156.80, "changePercent": 0.61},
-            {"name": "SENSEX", "value": 84023.69, "change": 525.42, "changePercent": 0.63},
-            {"name": "BANK NIFTY", "value": 54258.75, "change": -125.30, "changePercent": -0.23},
-        ]
+        "id": watchlist_id,
+        "name": rows[0]["name"],
+        "stocks": [build_stock(symbol, live_quotes.get(symbol)) for symbol in symbols],
     }
 
+# Angel One से live data आने तक (या mock mode में) यही दिखता है
+DEFAULT_INDICES_JSON = orjson.dumps({
+    "indices": [
+        {"name": "NIFTY 50", "value": 25674.25, "change": 156.80, "changePercent": 0.61},
+        {"name": "SENSEX", "value": 84023.69, "change": 525.42, "changePercent": 0.63},
+        {"name": "BANK NIFTY", "value": 54258.75, "change": -125.30, "changePercent": -0.23},
+    ]
+})
+
+@app.get("/api/market/indices")
+async def get_market_indices(request: Request):
+    # JSON bytes background refresher पहले ही बना चुका है; request path पर कोई upstream call नहीं
+    return etag_response(request, app.state.indices_json)
+
 @app.get("/health")
 async def health_check():
-    status = "Connected" if angel_api.jwt_token else "Mock"
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "angel_one_status": status,
+        "angel_one_status": app.state.angel_status,
     }
 
-app.mount("/", StaticFiles(directory=".", html=True), name="static")
+class CachedStaticFiles(StaticFiles):
+    # browser एक घंटे तक files दोबारा नहीं माँगता; files content-hashed नहीं हैं इसलिए immutable नहीं
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=3600"
+        return response
+
+# सिर्फ static/ directory serve करें (पहले "." से main.py, .env और DB भी खुले थे);
+# production में nginx/Caddy से serve करें और SERVE_STATIC=0 रखें ताकि event loop सिर्फ API संभाले
+if os.getenv("SERVE_STATIC", "1") != "0":
+    app.mount("/", CachedStaticFiles(directory="static", html=True), name="static")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
+    # workers के लिए app को import string से देना जरूरी है। हर worker अपना login, LTP cache
+    # और refreshers चलाता है, इसलिए SmartAPI की 10 req/s limit के हिसाब से default 2 रखा है
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", 2)),
+    )